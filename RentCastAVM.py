@@ -1,16 +1,87 @@
 import os
 import sys
-import json
+import gzip
+import functools
+import orjson
+import ijson
 import requests
 import logging
-from urllib.parse import quote
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime, timedelta
 from google.cloud import storage
-from io import StringIO
+from google.api_core.exceptions import Conflict
+from collections import deque, OrderedDict
+from itertools import islice
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Cleanup only needs each blob's name and creation time; nextPageToken keeps pagination working
+CLEANUP_LIST_FIELDS = "items(name,timeCreated),nextPageToken"
+
+def normalize_address(address):
+    """Collapse whitespace and case so the same address always compares equal"""
+    return " ".join((address or "").split()).lower()
+
+class BufferedLogHandler(logging.Handler):
+    """Logging handler that keeps the most recent formatted records in a bounded deque"""
+    
+    def __init__(self, capacity):
+        """
+        Initialize the handler
+        
+        Args:
+            capacity: Maximum number of log lines retained; oldest lines are dropped first
+        """
+        super().__init__()
+        self.lines = deque(maxlen=capacity)
+    
+    def emit(self, record):
+        try:
+            self.lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+class RateLimiter:
+    """Thread-safe token bucket that spaces calls to a steady rate per second"""
+    
+    def __init__(self, calls_per_second):
+        """
+        Initialize the limiter
+        
+        Args:
+            calls_per_second: Sustained call rate; also the largest burst allowed
+        """
+        self.rate = float(calls_per_second)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a call is allowed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            # Sleep outside the lock so other threads can refill and check
+            time.sleep(wait)
+
 class PortFileAVMProcessor:
     def __init__(self, api_key):
         """
@@ -21,46 +92,104 @@ class PortFileAVMProcessor:
             comp_count: Number of comparables (default: 5)
         """
         self.api_key = api_key
-        self.comp_count = os.getenv('COMP_COUNT')
-        self.maxRadius=os.getenv('MAX_RADIUS')   ########### Miles
-        self.daysOld=os.getenv('DAYS_OLD')         ######### Days
-        self.lookupSubjectAttributes=os.getenv('LOOKUP_SUBJECT_ATTRIBUTES')   ##### Boolean
+        self.comp_count = int(os.getenv('COMP_COUNT', 5))
+        self.maxRadius=float(os.getenv('MAX_RADIUS', 5))   ########### Miles
+        self.daysOld=int(os.getenv('DAYS_OLD', 270))         ######### Days
+        self.lookupSubjectAttributes=os.getenv('LOOKUP_SUBJECT_ATTRIBUTES', 'true').lower() == 'true'   ##### Boolean
+        
+        # Client specific parameters are identical for every call, so build them once
+        self.clientParams = {
+            "compCount": self.comp_count,
+            "maxRadius": self.maxRadius,
+            "daysOld": self.daysOld,
+            "lookupSubjectAttributes": str(self.lookupSubjectAttributes).lower()
+        }
+        self.urlPrefix = f"https://api.rentcast.io/v1/avm/value?{urlencode(self.clientParams)}&"
+        
         self.bucket_name = "port-file-avm"
         self.base_folder="AVM"
         self.input_file = f"{self.base_folder}/portfolio.json"
         self.output_folder = "JSON"
         self.log_folder = "Logs"
+        self.manifest_folder = f"{self.base_folder}/_manifest"
+        
+        # Checkpoint of input rows already saved for the current input file, used to resume interrupted runs
+        self.inputGeneration = None
+        self.completedRows = set()
+        self.skippedCount = 0
         
         #####Define Batch Size
-        self.batchSize=os.getenv('BATCH_SIZE')
+        self.batchSize=int(os.getenv('BATCH_SIZE', 100))
+        
+        #####Define number of concurrent RentCast calls per batch
+        self.maxConcurrency=int(os.getenv('MAX_CONCURRENCY', 16))
+        
+        #####Define number of batch uploads allowed in flight
+        self.uploadConcurrency=int(os.getenv('UPLOAD_CONCURRENCY', 4))
+        
+        #####Define number of distinct property lookups remembered within a run
+        self.responseCacheSize=int(os.getenv('RESPONSE_CACHE_SIZE', 4096))
+        
+        # In-run cache of RentCast lookups shared by worker threads, so duplicate properties cost one API call
+        self.responseCache = OrderedDict()
+        self.responseCacheLock = threading.Lock()
+        self.cacheHits = 0
+        
+        #####Define RentCast calls allowed per second across all worker threads (0 disables)
+        rateLimit=float(os.getenv('RATE_LIMIT_PER_SECOND', 20))
+        self.rateLimiter = RateLimiter(rateLimit) if rateLimit > 0 else None
+        
+        # Pooled HTTP session so RentCast calls reuse keep-alive connections
+        self.session = self.create_session()
         
         # Setup logging
         self.setup_logging()
         
+        # Shared GCS client and bucket handle, reused by every storage operation
+        self.storage_client = storage.Client()
+        #.from_service_account_json(os.getenv('GOOGLE_APPLICATION_KEY'))
+        self.bucket = self.storage_client.bucket(self.bucket_name)
+        
         #Create Project Bucket If not exist
         self.create_bucket()
     
+    def create_session(self):
+        """Create a requests Session with connection pooling and retries for RentCast calls"""
+        session = requests.Session()
+        retries = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False
+        )
+        # One pooled connection per worker thread in process_batch
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.maxConcurrency, max_retries=retries)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "X-Api-Key": self.api_key,
+            "Accept": "application/json"
+        })
+        return session
+    
     def create_bucket(self):
         
         BucketName=self.bucket_name
-        
-        storage_client = storage.Client()
-        #.from_service_account_json(os.getenv('GOOGLE_APPLICATION_KEY'))
-        bucket = storage_client.bucket(BucketName)
+        bucket = self.bucket
 
-        # Try to create the bucket
+        # Try to create the bucket; an existing bucket answers 409 Conflict, so no separate exists() call is needed
         try:
-            if not bucket.exists():
-                bucket.create()
-                self.logger.info(f"Bucket {BucketName} created.")
+            bucket.create()
+            self.logger.info(f"Bucket {BucketName} created.")
+        except Conflict:
+            pass
         except Exception as e:
             self.logger.info(f"Failed to create bucket {BucketName}: {e}")
             
     def setup_logging(self):
-        """Setup logging configuration with StringIO buffer and console handlers"""
+        """Setup logging configuration with bounded in-memory buffer and console handlers"""
         # Create logger
         self.logger = logging.getLogger('PortFileAVMProcessor')
-        self.logger.setLevel(logging.INFO)
+        self.logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
         
         # Clear existing handlers
         self.logger.handlers = []
@@ -73,44 +202,65 @@ class PortFileAVMProcessor:
         
         # Console handler
         console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
+        console_handler.setLevel(logging.DEBUG)
         console_handler.setFormatter(formatter)
         self.logger.addHandler(console_handler)
         
-        # StringIO buffer for log storage
-        self.log_buffer = StringIO()
-        buffer_handler = logging.StreamHandler(self.log_buffer)
-        buffer_handler.setLevel(logging.DEBUG)
+        # Bounded in-memory buffer for log storage, so long runs cannot grow it without limit
+        buffer_handler = BufferedLogHandler(int(os.getenv('LOG_BUFFER_LINES', 100000)))
+        self.log_buffer = buffer_handler.lines
+        # Per-property DEBUG chatter stays out of the uploaded log
+        buffer_handler.setLevel(logging.INFO)
         buffer_handler.setFormatter(formatter)
         self.logger.addHandler(buffer_handler)
         
         self.logger.info("Logging initialized")
     
     def upload_log_to_gcp(self):
-        """Upload log from StringIO buffer to GCP bucket"""
+        """Upload log from in-memory buffer to GCP bucket"""
         try:
             # Generate log filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             log_filename = f"portfolio_avm_{timestamp}.log"
             log_path = f"{self.log_folder}/{log_filename}"
             
-            # Get log content from buffer
-            log_content = self.log_buffer.getvalue()
+            # Snapshot buffered lines so records logged during the upload cannot mutate the iteration
+            log_lines = list(self.log_buffer)
             
-            # Upload to GCP
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            # Stream lines to GCP instead of joining them into one large string
+            bucket = self.bucket
             blob = bucket.blob(log_path)
-            blob.upload_from_string(log_content, content_type='text/plain')
+            with blob.open('w', content_type='text/plain', encoding='utf-8', chunk_size=256*1024) as f:
+                for line in log_lines:
+                    f.write(line + "\n")
             
             self.logger.info(f"Log file uploaded to GCP: {log_path}")
             
-            # Close the buffer
-            self.log_buffer.close()
+            # Clear the buffer
+            self.log_buffer.clear()
                 
         except Exception as e:
             self.logger.error(f"Error uploading log to GCP: {e}")
     
+    def delete_blobs_in_batches(self, blobs, batch_size=100):
+        """
+        Delete blobs using GCS batch requests instead of one request per blob
+        
+        Args:
+            blobs: List of blobs to delete
+            batch_size: Maximum deletes per batch request (GCS limit: 100)
+            
+        Returns:
+            int: Number of blobs deleted
+        """
+        for start_idx in range(0, len(blobs), batch_size):
+            # Deletes queued inside the batch context are sent as one multipart request
+            with self.storage_client.batch():
+                for blob in blobs[start_idx:start_idx + batch_size]:
+                    blob.delete()
+        
+        return len(blobs)
+    
     def cleanup_old_logs(self, days=7):
         """
         Delete log files older than specified days
@@ -119,17 +269,24 @@ class PortFileAVMProcessor:
             days: Number of days to retain logs (default: 7)
         """
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            bucket = self.bucket
             
             cutoff_date = datetime.now() - timedelta(days=days)
-            deleted_count = 0
             
             self.logger.info(f"Cleaning up log files older than {days} days...")
             
-            # List all blobs in the Logs folder
-            blobs = bucket.list_blobs(prefix=f"{self.log_folder}/")
-            
+            # Log names embed their timestamp, so listing can stop at the cutoff name.
+            # Blobs whose names sort at or after the cutoff are never listed, so files not
+            # following the naming scheme are no longer cleaned up
+            cutoff_name = f"{self.log_folder}/portfolio_avm_{cutoff_date.strftime('%Y%m%d_%H%M%S')}"
+            blobs = bucket.list_blobs(
+                prefix=f"{self.log_folder}/",
+                end_offset=cutoff_name,
+                fields=CLEANUP_LIST_FIELDS,
+                page_size=1000
+            )
+            
+            stale_blobs = []
             for blob in blobs:
                 # Get blob creation time
                 if blob.time_created:
@@ -138,8 +295,9 @@ class PortFileAVMProcessor:
                     
                     if blob_date < cutoff_date:
                         self.logger.info(f"Deleting old log file: {blob.name}")
-                        blob.delete()
-                        deleted_count += 1
+                        stale_blobs.append(blob)
+            
+            deleted_count = self.delete_blobs_in_batches(stale_blobs)
             
             self.logger.info(f"Deleted {deleted_count} old log file(s)")
             
@@ -154,17 +312,24 @@ class PortFileAVMProcessor:
             days: Number of days to retain processed files (default: 100)
         """
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            bucket = self.bucket
             
             cutoff_date = datetime.now() - timedelta(days=days)
-            deleted_count = 0
             
             self.logger.info(f"Cleaning up processed files older than {days} days...")
             
-            # List all blobs in the Input/processed folder
-            blobs = bucket.list_blobs(prefix=f"{self.base_folder}/processed/")
-            
+            # Processed names embed their timestamp, so listing can stop at the cutoff name.
+            # Blobs whose names sort at or after the cutoff are never listed, so files not
+            # following the naming scheme are no longer cleaned up
+            cutoff_name = f"{self.base_folder}/processed/portfolio_{cutoff_date.strftime('%Y%m%d_%H%M%S')}"
+            blobs = bucket.list_blobs(
+                prefix=f"{self.base_folder}/processed/",
+                end_offset=cutoff_name,
+                fields=CLEANUP_LIST_FIELDS,
+                page_size=1000
+            )
+            
+            stale_blobs = []
             for blob in blobs:
                 # Get blob creation time
                 if blob.time_created:
@@ -173,8 +338,9 @@ class PortFileAVMProcessor:
                     
                     if blob_date < cutoff_date:
                         self.logger.info(f"Deleting old processed file: {blob.name}")
-                        blob.delete()
-                        deleted_count += 1
+                        stale_blobs.append(blob)
+            
+            deleted_count = self.delete_blobs_in_batches(stale_blobs)
             
             self.logger.info(f"Deleted {deleted_count} old processed file(s)")
             
@@ -182,28 +348,132 @@ class PortFileAVMProcessor:
             self.logger.error(f"Error cleaning up old processed files: {e}")
     
     def read_addresses_from_gcp(self):
-        """Read addresses from a JSON file in GCP bucket"""
+        """
+        Stream property records from the JSON array file in GCP bucket
+        
+        Yields:
+            dict: One property record at a time
+        """
+        count = 0
         try:
             self.logger.info(f"Reading addresses from {self.bucket_name}/{self.input_file}")
 
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            bucket = self.bucket
             blob = bucket.blob(self.input_file)
 
-            # Download full file content as text
-            content = blob.download_as_text()
+            # Parse the JSON array incrementally while it downloads instead of loading it whole
+            with blob.open('rb', chunk_size=1024*1024) as f:
+                for property in ijson.items(f, 'item', use_float=True):
+                    count += 1
+                    yield property
             
-            # Parse JSON content
-            addresses = json.loads(content)
-            
-            self.logger.info(f"Successfully read {len(addresses)} addresses from GCP")
-            return addresses
+            self.logger.info(f"Successfully read {count} addresses from GCP")
 
         except Exception as e:
             self.logger.error(f"Error reading from GCP: {e}")
-            return []
+            
+            # A partially read file must not be treated as complete and moved to processed
+            if count:
+                raise
 
 
+    def load_manifest(self):
+        """Load the checkpoint of input rows already saved for the current input file"""
+        try:
+            bucket = self.bucket
+            
+            input_blob = bucket.get_blob(self.input_file)
+            if input_blob is None:
+                return
+            self.inputGeneration = input_blob.generation
+            
+            # Checkpoints are kept per input generation, so a replaced input file starts afresh
+            prefix = f"{self.manifest_folder}/{self.inputGeneration}/"
+            for blob in bucket.list_blobs(prefix=prefix):
+                for line in blob.download_as_bytes().splitlines():
+                    if line.strip():
+                        self.completedRows.add(orjson.loads(line)['row'])
+            
+            if self.completedRows:
+                self.logger.info(f"Resuming: {len(self.completedRows)} row(s) already saved for this input file")
+            
+        except Exception as e:
+            self.logger.error(f"Error loading checkpoint manifest: {e}")
+    
+    def save_manifest(self, batch_results, positions, filename):
+        """
+        Record the successful input rows of a saved batch in a checkpoint object of its own
+        
+        Args:
+            batch_results: List of results for a batch already saved to GCP
+            positions: Input row positions of the batch, in the same order as batch_results
+            filename: Name of the batch's output file, reused for its checkpoint object
+        """
+        lines = [
+            orjson.dumps({"row": row})
+            for row, r in zip(positions, batch_results) if r.get('status') == 'success'
+        ]
+        if not lines or self.inputGeneration is None:
+            return
+        
+        try:
+            # One small object per batch, so uploads never rewrite earlier checkpoints
+            name = filename.rsplit('.', 1)[0] + ".ndjson"
+            blob = self.bucket.blob(f"{self.manifest_folder}/{self.inputGeneration}/{name}")
+            
+            # Fail rather than overwrite a checkpoint written by a concurrent run
+            blob.upload_from_string(
+                b"\n".join(lines) + b"\n",
+                content_type='application/x-ndjson',
+                if_generation_match=0
+            )
+            
+        except Exception as e:
+            self.logger.error(f"Error saving checkpoint manifest: {e}")
+    
+    def delete_manifest(self):
+        """Remove all checkpoint objects once the input file has been fully processed"""
+        try:
+            blobs = list(self.bucket.list_blobs(prefix=f"{self.manifest_folder}/"))
+            self.delete_blobs_in_batches(blobs)
+                
+        except Exception as e:
+            self.logger.error(f"Error deleting checkpoint manifest: {e}")
+    
+    def skip_completed(self, properties):
+        """
+        Number the input rows and filter out those already saved by an earlier attempt
+        
+        Args:
+            properties: Iterable of property dicts, in input file order
+            
+        Yields:
+            tuple: (input row position, property) for rows that still need processing
+        """
+        for row, property in enumerate(properties):
+            if row in self.completedRows:
+                self.skippedCount += 1
+                continue
+            yield row, property
+    
+    def next_batch_number(self):
+        """
+        Get the first unused batch number for today's output files
+        
+        Returns:
+            int: Batch number that does not overwrite batches saved earlier today
+        """
+        date_str = datetime.now().strftime("%y%m%d")
+        prefix = f"{self.output_folder}/portfolio_avm_{date_str}_"
+        
+        numbers = []
+        for blob in self.bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken"):
+            stem = blob.name[len(prefix):].split('.')[0]
+            if stem.isdigit():
+                numbers.append(int(stem))
+        
+        return max(numbers, default=0) + 1
+    
     def call_rentcast_api(self, property):
         """
         Call RentCast API for a single address
@@ -215,40 +485,39 @@ class PortFileAVMProcessor:
             dict: API response data or error information
         """
         try:
-            #print(property)
             address=property.get('address')
-            property_type=quote(property.get('propertyType'))
-            bedrooms=property.get('bedrooms')
-            bathrooms=property.get('bathrooms')
             square_footage=property.get('squareFootage')
             
-            urlComparableParameters=f"propertyType={property_type}&bedrooms={bedrooms}&bathrooms={bathrooms}"
+            # Comparable parameters; client specific parameters are already encoded in urlPrefix
+            params = {
+                "address": address,
+                "propertyType": property.get('propertyType'),
+                "bedrooms": property.get('bedrooms'),
+                "bathrooms": property.get('bathrooms')
+            }
 
-            if square_footage>0:
-                urlComparableParameters+=f"&squareFootage={square_footage}"
+            if square_footage and square_footage>0:
+                params["squareFootage"] = square_footage
             
-            clientSpecificUrlParamters=f"maxRadius={self.maxRadius}&daysOld={self.daysOld}&lookupSubjectAttributes={self.lookupSubjectAttributes}"
+            url = self.urlPrefix + urlencode(params)
             
-            encoded_address = quote(address)
-            url = f"https://api.rentcast.io/v1/avm/value?address={encoded_address}&compCount={self.comp_count}&{clientSpecificUrlParamters}&{urlComparableParameters}"
+            self.logger.debug("Calling API for address: %s (%s)", address, url)
             
-            headers = {
-                "X-Api-Key": self.api_key,
-                "Accept": "application/json"
-            }
-            self.logger.info(url)
-            self.logger.debug(f"Calling API for address: {address}")
-            response = requests.get(url, headers=headers, timeout=30)
+            # Stay under the RentCast quota instead of spending calls on 429 responses
+            if self.rateLimiter:
+                self.rateLimiter.acquire()
+            
+            response = self.session.get(url, timeout=(3.05, 30))
             
             if response.status_code == 200:
-                self.logger.info(f"SUCCESS: {address}")
+                self.logger.debug("SUCCESS: %s", address)
                 return {
                     "address": address,
                     "status": "success",
-                    "data": response.json()
+                    "data": orjson.loads(response.content)
                 }
             else:
-                self.logger.warning(f"ERROR: API Error for {address}: Status {response.status_code}")
+                self.logger.warning("ERROR: API Error for %s: Status %s", address, response.status_code)
                 return {
                     "address": address,
                     "status": "error",
@@ -257,13 +526,68 @@ class PortFileAVMProcessor:
                 }
                 
         except Exception as e:
-            self.logger.error(f"EXCEPTION for {address}: {str(e)}")
+            self.logger.error("EXCEPTION for %s: %s", address, e)
             return {
                 "address": address,
                 "status": "error",
                 "error_message": str(e)
             }
     
+    def lookup_property(self, property):
+        """
+        Get AVM data for a property, calling RentCast at most once per distinct property in a run
+        
+        Args:
+            property: Dict containing property details
+            
+        Returns:
+            dict: API response data or error information
+        """
+        address = property.get('address')
+        
+        try:
+            # Case and whitespace differences in the address still identify the same property
+            cache_key = (
+                normalize_address(address),
+                property.get('propertyType'),
+                property.get('bedrooms'),
+                property.get('bathrooms'),
+                property.get('squareFootage')
+            )
+            hash(cache_key)
+        except (TypeError, AttributeError):
+            # Malformed fields (e.g. a list) cannot be cached, so look the property up directly
+            self.logger.debug("Uncacheable property, skipping cache: %s", address)
+            return self.call_rentcast_api(property)
+        
+        with self.responseCacheLock:
+            pending = self.responseCache.get(cache_key)
+            owner = pending is None
+            
+            if owner:
+                # Register the lookup before calling the API so concurrent duplicates wait for it
+                pending = self.responseCache[cache_key] = Future()
+                if len(self.responseCache) > self.responseCacheSize:
+                    self.responseCache.popitem(last=False)
+            else:
+                self.responseCache.move_to_end(cache_key)
+                self.cacheHits += 1
+        
+        if not owner:
+            self.logger.debug("CACHED: %s", address)
+            return {**pending.result(), "address": address}
+        
+        result = self.call_rentcast_api(property)
+        
+        if result.get('status') != 'success':
+            # Only successes are kept, so a later duplicate retries a failed lookup
+            with self.responseCacheLock:
+                if self.responseCache.get(cache_key) is pending:
+                    del self.responseCache[cache_key]
+        
+        pending.set_result(result)
+        return result
+    
     def process_batch(self, properties):
         """
         Process a batch of property JSON objects
@@ -272,36 +596,42 @@ class PortFileAVMProcessor:
             properties: List of dicts, each containing property details
             
         Returns:
-            list: Results for all properties in the batch
+            tuple: (results for all properties in the batch, success count, error count)
         """
         results = []
         success_count = 0
         error_count = 0
+        total = len(properties)
         
-        for idx, property in enumerate(properties, 1):
-            #print(property)
-            self.logger.info(f"Processing property {idx}/{len(properties)}: {property.get('address')}")
+        def call_with_progress(indexed_property):
+            idx, property = indexed_property
+            self.logger.debug("Processing property %d/%d: %s", idx, total, property.get('address'))
             
             # Pass the entire property dict or unpack specific params as needed
-            result = self.call_rentcast_api(property) 
-            
-            results.append(result)
-            
-            if result.get('status') == 'success':
-                success_count += 1
-            else:
-                error_count += 1
+            return self.lookup_property(property)
+        
+        # API calls are I/O bound, so overlap them on a bounded thread pool;
+        # executor.map yields results in input order
+        with ThreadPoolExecutor(max_workers=self.maxConcurrency) as executor:
+            for result in executor.map(call_with_progress, enumerate(properties, 1)):
+                results.append(result)
+                
+                if result.get('status') == 'success':
+                    success_count += 1
+                else:
+                    error_count += 1
         
         self.logger.info(f"Batch complete - Success: {success_count}, Errors: {error_count}")
-        return results
+        return results, success_count, error_count
         
-    def save_batch_to_gcp(self, batch_results, batch_number):
+    def save_batch_to_gcp(self, batch_results, batch_number, positions):
         """
         Save batch results to GCP as JSON
         
         Args:
             batch_results: List of results for the batch
             batch_number: Batch number for file naming
+            positions: Input row positions of the batch, used for the checkpoint
         """
         try:
             
@@ -310,17 +640,20 @@ class PortFileAVMProcessor:
             filename = f"portfolio_avm_{date_str}_{batch_number:03d}.json"
             filepath = f"{self.output_folder}/{filename}"
             
-            # Convert to JSON
-            json_content = json.dumps(batch_results, indent=2)
+            # Convert to compact JSON bytes and gzip them; repeated response keys compress well
+            json_content = gzip.compress(orjson.dumps(batch_results), compresslevel=6)
             
-            # Upload to GCP
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            # Upload to GCP; GCS transparently decompresses for clients that do not accept gzip
+            bucket = self.bucket
             blob = bucket.blob(filepath)
+            blob.content_encoding = 'gzip'
             blob.upload_from_string(json_content, content_type='application/json')
             
             self.logger.info(f"Successfully saved {filename} to GCP ({len(batch_results)} records)")
             
+            # Checkpoint only after the batch is durably saved
+            self.save_manifest(batch_results, positions, filename)
+            
         except Exception as e:
             self.logger.error(f"Error saving batch to GCP: {e}")
     
@@ -329,8 +662,7 @@ class PortFileAVMProcessor:
         try:
             self.logger.info(f"Moving {self.input_file} to processed folder...")
             
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
+            bucket = self.bucket
             
             # Generate timestamped filename for processed file
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -339,13 +671,13 @@ class PortFileAVMProcessor:
             # Get source blob
             source_blob = bucket.blob(self.input_file)
             
-            # Copy to processed folder with timestamp
-            bucket.copy_blob(source_blob, bucket, processed_filename)
+            # Server-side rename into the processed folder with timestamp
+            new_blob = bucket.rename_blob(source_blob, processed_filename)
             
-            # Delete original
-            source_blob.delete()
+            self.logger.info(f"Successfully moved {self.input_file} to {new_blob.name}")
             
-            self.logger.info(f"Successfully moved {self.input_file} to {processed_filename}")
+            # The input is fully processed, so its checkpoint is no longer needed
+            self.delete_manifest()
             
         except Exception as e:
             self.logger.error(f"Error moving file: {e}")
@@ -361,47 +693,57 @@ class PortFileAVMProcessor:
             self.cleanup_old_logs(days=7)
             self.cleanup_old_processed_files(days=100)
             
-            # Read addresses from GCP
-            addresses = self.read_addresses_from_gcp()
+            # Load the checkpoint so a rerun skips rows an interrupted attempt already saved
+            self.load_manifest()
             
-            if not addresses:
-                self.logger.warning("No addresses found to process")
-                return
+            # Stream addresses from GCP
+            addresses = self.skip_completed(self.read_addresses_from_gcp())
+            
+            # Continue numbering after batches already saved today so none are overwritten
+            batch_offset = self.next_batch_number() - 1
             
             # Process in batches of 100
-            batch_size = int(self.batchSize)   #100
-            total_batches = (len(addresses) + batch_size - 1) // batch_size
+            batch_size = self.batchSize   #100
             
-            self.logger.info(f"Total addresses: {len(addresses)}")
             self.logger.info(f"Batch size: {batch_size}")
-            self.logger.info(f"Total batches: {total_batches}")
             self.logger.info("-"*70)
             
+            total_addresses = 0
             overall_success = 0
             overall_errors = 0
             
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min(start_idx + batch_size, len(addresses))
-                batch_addresses = addresses[start_idx:end_idx]
-                
-                self.logger.info(f"\n{'='*70}")
-                self.logger.info(f"Processing Batch {batch_num + 1}/{total_batches}")
-                self.logger.info(f"Addresses: {start_idx + 1} to {end_idx}")
-                self.logger.info(f"{'='*70}")
-                
-                # Process the batch
-                batch_results = self.process_batch(batch_addresses)
-                
-                # Count successes and errors
-                batch_success = sum(1 for r in batch_results if r['status'] == 'success')
-                batch_errors = sum(1 for r in batch_results if r['status'] == 'error')
-                
-                overall_success += batch_success
-                overall_errors += batch_errors
-                
-                # Save results to GCP
-                self.save_batch_to_gcp(batch_results, batch_num + 1)
+            # Leaving the with block waits for all pending uploads before the input file is moved
+            with ThreadPoolExecutor(max_workers=self.uploadConcurrency) as upload_pool:
+                batch_num = 0
+                while True:
+                    # Pull only the next batch from the stream
+                    batch_rows = list(islice(addresses, batch_size))
+                    if not batch_rows:
+                        break
+                    positions = [row for row, _ in batch_rows]
+                    batch_addresses = [property for _, property in batch_rows]
+                    
+                    batch_num += 1
+                    start_idx = total_addresses
+                    total_addresses += len(batch_addresses)
+                    
+                    self.logger.info(f"\n{'='*70}")
+                    self.logger.info(f"Processing Batch {batch_num}")
+                    self.logger.info(f"Addresses: {start_idx + 1} to {total_addresses}")
+                    self.logger.info(f"{'='*70}")
+                    
+                    # Process the batch; it counts successes and errors as results arrive
+                    batch_results, batch_success, batch_errors = self.process_batch(batch_addresses)
+                    
+                    overall_success += batch_success
+                    overall_errors += batch_errors
+                    
+                    # Save results to GCP in the background so the next batch's API calls overlap the upload
+                    upload_pool.submit(self.save_batch_to_gcp, batch_results, batch_offset + batch_num, positions)
+            
+            if not total_addresses and not self.skippedCount:
+                self.logger.warning("No addresses found to process")
+                return
             
             # Move input file to processed folder
             self.logger.info("\n" + "="*70)
@@ -412,16 +754,23 @@ class PortFileAVMProcessor:
             self.logger.info("\n" + "="*70)
             self.logger.info("PROCESSING COMPLETE")
             self.logger.info("="*70)
-            self.logger.info(f"Total addresses processed: {len(addresses)}")
+            self.logger.info(f"Total addresses processed: {total_addresses}")
+            self.logger.info(f"Duplicate addresses served from cache: {self.cacheHits}")
+            self.logger.info(f"Total batches: {batch_num}")
             self.logger.info(f"Successful: {overall_success}")
             self.logger.info(f"Errors: {overall_errors}")
-            self.logger.info(f"Success rate: {(overall_success/len(addresses)*100):.2f}%")
+            self.logger.info(f"Skipped (saved by an earlier attempt): {self.skippedCount}")
+            if total_addresses:
+                self.logger.info(f"Success rate: {(overall_success/total_addresses*100):.2f}%")
             self.logger.info("="*70)
             
         except Exception as e:
             self.logger.error(f"Critical error in main processing: {e}", exc_info=True)
             
         finally:
+            # Release pooled HTTP connections
+            self.session.close()
+            
             # Upload log to GCP
             self.upload_log_to_gcp()
 
@@ -429,7 +778,11 @@ class PortFileAVMProcessor:
 from google.cloud import secretmanager
 import google_crc32c
 
-def access_secret_version(project_id: str, secret_id: str, version_id: str) -> secretmanager.AccessSecretVersionResponse:  
+# The C extension uses the hardware CRC32C instruction; the pure-Python fallback is far slower
+if google_crc32c.implementation != "c":
+    logger.warning("google_crc32c is using the pure-Python implementation; reinstall google-crc32c with its C extension")
+
+def access_secret_version(project_id: str, secret_id: str, version_id: str) -> str:  
     client = secretmanager.SecretManagerServiceClient()
 
     name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
@@ -437,25 +790,25 @@ def access_secret_version(project_id: str, secret_id: str, version_id: str) -> s
     # Access the secret version.
     response = client.access_secret_version(request={"name": name})
 
-    # Verify payload checksum.
-    crc32c = google_crc32c.Checksum()
-    crc32c.update(response.payload.data)
-    
-    if response.payload.data_crc32c != int(crc32c.hexdigest(), 16):
-        print("Data corruption detected.")
-        return response
+    # Verify payload checksum in a single call instead of Checksum().update()/hexdigest().
+    if response.payload.data_crc32c != google_crc32c.value(response.payload.data):
+        logger.error("Data corruption detected.")
+        raise RuntimeError("Secret payload CRC32C mismatch")
 
     payload = response.payload.data.decode("UTF-8")
     
     return payload
 ###################Google Secret Code Section Ends Here######################################################
 
+# Warm Cloud Function instances reuse the key instead of calling Secret Manager on every request;
+# failures raise and are not cached
+@functools.lru_cache(maxsize=1)
 def GetRentCastAPIKeyFromSecrets():
     try:
 
         return access_secret_version(os.getenv('SECRET_PROJECT_ID'),os.getenv('SECRET_KEY_RENTCAST'),'latest')
     except Exception as e:
-        print("Exception Raiased in "+sys._getframe().f_code.co_name +"...."+str(e))
+        logger.error("Exception Raiased in %s....%s", sys._getframe().f_code.co_name, e)
         raise Exception("GetRentCastAPIKeyFromSecrets --Issue "+str(e))
             
 # Main execution